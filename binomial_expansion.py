@@ -1,5 +1,10 @@
 import re
-import math
+from functools import lru_cache
+from math import comb
+
+ROW_CACHE_SIZE = 64
+CACHED_ROW_LIMIT = 4096
+KRONECKER_THRESHOLD = 32
 
 
 def parse_expression(expression):
@@ -17,10 +22,116 @@ def parse_expression(expression):
 
     return a, b, n, x
 
+@lru_cache(maxsize=ROW_CACHE_SIZE)
+def binomial_row(n):
+    """ n-я строка треугольника Паскаля: C(n, k+1) = C(n, k) * (n - k) / (k + 1), вторая половина зеркальна """
+    row = [1] * (n + 1)
+    c = 1
+    for k in range(n // 2):
+        c = c * (n - k) // (k + 1)
+        row[k + 1] = row[n - k - 1] = c
+    return tuple(row)
+
+def iter_binomial_row(n):
+    if n <= CACHED_ROW_LIMIT:
+        yield from binomial_row(n)
+        return
+    # длинные строки не кэшируем, чтобы не держать в памяти все коэффициенты сразу
+    c = 1
+    yield c
+    for k in range(n):
+        c = c * (n - k) // (k + 1)
+        yield c
+
 def binomial_coefficient(n, k):
-    if k == 0 or k == n:
-        return 1
-    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+    if n <= CACHED_ROW_LIMIT:
+        return binomial_row(n)[k]
+    # ради одного коэффициента длинную строку не строим и не кэшируем
+    return comb(n, k)
+
+def iter_coefficients(a, b, n):
+    if a == 0:
+        yield from (0 for _ in range(n))
+        yield b ** n
+        return
+    a_power = a ** n
+    b_power = 1
+    for c in iter_binomial_row(n):
+        yield c * a_power * b_power
+        a_power //= a
+        b_power *= b
+
+def is_prime_modulus(p):
+    if p < 2:
+        return False
+    for q in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if p % q == 0:
+            return p == q
+    d = p - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for q in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        x = pow(q, d, p)
+        if x == 1 or x == p - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % p
+            if x == p - 1:
+                break
+        else:
+            return False
+    return True
+
+@lru_cache(maxsize=8)
+def factorial_tables(size, p):
+    fact = [1] * size
+    for i in range(1, size):
+        fact[i] = fact[i - 1] * i % p
+    inv_fact = [1] * size
+    inv_fact[-1] = pow(fact[-1], p - 2, p)
+    for i in range(size - 1, 0, -1):
+        inv_fact[i - 1] = inv_fact[i] * i % p
+    return fact, inv_fact
+
+def lucas_binomial(n, k, p, fact, inv_fact):
+    """ Теорема Люка: C(n, k) mod p - произведение C(n_i, k_i) по цифрам в системе счисления p """
+    result = 1
+    while k:
+        ni, ki = n % p, k % p
+        if ki > ni:
+            return 0
+        result = result * fact[ni] * inv_fact[ki] * inv_fact[ni - ki] % p
+        n //= p
+        k //= p
+    return result
+
+def iter_binomial_row_mod(n, p):
+    if not is_prime_modulus(p):
+        raise ValueError(f"Modulus must be prime, got {p}")
+    if n < p:
+        fact, inv_fact = factorial_tables(n + 1, p)
+        for k in range(n + 1):
+            yield fact[n] * inv_fact[k] * inv_fact[n - k] % p
+    else:
+        fact, inv_fact = factorial_tables(p, p)
+        for k in range(n + 1):
+            yield lucas_binomial(n, k, p, fact, inv_fact)
+
+def iter_coefficients_mod(a, b, n, p):
+    a, b = int(a) % p, int(b) % p
+    row = iter_binomial_row_mod(n, p)
+    if a == 0:
+        for k, c in enumerate(row):
+            yield c * pow(b, n, p) % p if k == n else 0
+        return
+    # a^(n-k) * b^k = a^n * (b / a)^k
+    ratio = b * pow(a, p - 2, p) % p
+    power = pow(a, n, p)
+    for c in row:
+        yield c * power % p
+        power = power * ratio % p
 
 def optional_plus(coefficient, include_plus_sign):
     if coefficient < 0:
@@ -30,7 +141,9 @@ def optional_plus(coefficient, include_plus_sign):
 
 def pretty_coefficient(coefficient, include_plus_sign=False, return_if_one=False):
     if coefficient == 1:
-        return optional_plus(coefficient, include_plus_sign) if return_if_one else ''
+        if return_if_one:
+            return optional_plus(coefficient, include_plus_sign)
+        return '+' if include_plus_sign else ''
     if coefficient == -1:
         return optional_plus(coefficient, include_plus_sign) if return_if_one else '-'
     return optional_plus(coefficient, include_plus_sign)
@@ -43,18 +156,111 @@ def term(coefficient, variable, power, include_plus_sign=False, return_coeff_if_
         return f'{pretty_coeff}{variable}'
     return f'{pretty_coeff}{variable}^{power}'
 
-def expand(expr):
+def iter_terms(expr, modulus=None):
     a, b, n, x = parse_expression(expr)
 
-    binomial_coefficients = [binomial_coefficient(n, k) for k in range(n + 1)]
-    expression_coefficients = [a ** (n - k) * b ** k for k in range(n + 1)]
-    resulting_coefficients = [binomial_coefficients[k] * expression_coefficients[k] for k in range(n + 1)]
-    res = ''
-    for i in range(n+1):
-        if resulting_coefficients[i] != 0:
-            res += term(resulting_coefficients[i], x, n - i, i != 0, i == n)
+    coefficients = iter_coefficients(a, b, n) if modulus is None else iter_coefficients_mod(a, b, n, modulus)
+    first = True
+    for i, coefficient in enumerate(coefficients):
+        if coefficient != 0:
+            yield term(coefficient, x, n - i, not first, i == n)
+            first = False
+    if first:
+        yield '0'
+
+def expand_to(expr, fileobj, modulus=None):
+    fileobj.writelines(iter_terms(expr, modulus))
+
+def expand(expr, modulus=None):
+    return ''.join(iter_terms(expr, modulus))
+
+def parse_polynomial(expression):
+    match = re.fullmatch(r"\((.+)\)\^(\d+)", expression)
+    if not match:
+        raise ValueError("Invalid format. Expected format is (polynomial)^n")
+    body, n = match.groups()
+
+    terms = list(re.finditer(r"([-+]?)(\d*)(?:([a-z])(?:\^(\d+))?)?", body))
+    coefficients = {}
+    variables = set()
+    position = 0
+    for t in terms:
+        if t.start() == t.end():
+            continue
+        sign, digits, variable, power = t.groups()
+        if t.start() != position or (not digits and not variable) or (position > 0 and not sign):
+            raise ValueError(f"Invalid polynomial term at {t.start()}: {body}")
+        position = t.end()
+        coefficient = int(digits) if digits else 1
+        if variable:
+            variables.add(variable)
+        power = int(power) if power else (1 if variable else 0)
+        coefficients[power] = coefficients.get(power, 0) + (-coefficient if sign == '-' else coefficient)
+    if position != len(body) or len(variables) > 1:
+        raise ValueError(f"Invalid polynomial: {body}")
+
+    dense = [0] * (max(coefficients) + 1)
+    for power, coefficient in coefficients.items():
+        dense[power] = coefficient
+    return dense, int(n), variables.pop() if variables else 'x'
+
+def trim(coefficients):
+    while len(coefficients) > 1 and coefficients[-1] == 0:
+        coefficients.pop()
+    return coefficients
+
+def pack(coefficients, width, offset=0):
+    return int.from_bytes(b''.join((c + offset).to_bytes(width, 'little') for c in coefficients), 'little')
+
+def kronecker_multiply(f, g):
+    """ Подстановка Кронекера: многочлены упаковываются в большие числа, умножение делает длинная арифметика """
+    bound = min(len(f), len(g)) * max(map(abs, f)) * max(map(abs, g))
+    width = (bound.bit_length() + 2 + 7) // 8
+    size = len(f) + len(g) - 1
+
+    def signed_pack(h):
+        return pack([max(c, 0) for c in h], width) - pack([max(-c, 0) for c in h], width)
+
+    half = 1 << (8 * width - 1)
+    product = signed_pack(f) * signed_pack(g) + pack([0] * size, width, half)
+    raw = product.to_bytes(width * size, 'little')
+    return [int.from_bytes(raw[i:i + width], 'little') - half for i in range(0, len(raw), width)]
+
+def multiply(f, g):
+    if min(len(f), len(g)) >= KRONECKER_THRESHOLD:
+        return trim(kronecker_multiply(f, g))
+    result = [0] * (len(f) + len(g) - 1)
+    for i, a in enumerate(f):
+        if a:
+            for j, b in enumerate(g):
+                result[i + j] += a * b
+    return trim(result)
+
+def polynomial_power(coefficients, n):
+    result = [1]
+    base = trim(list(coefficients))
+    while n:
+        if n & 1:
+            result = multiply(result, base)
+        n >>= 1
+        if n:
+            base = multiply(base, base)
+    return result
+
+def iter_polynomial_terms(expr):
+    coefficients, n, x = parse_polynomial(expr)
+    result = polynomial_power(coefficients, n)
+
+    first = True
+    for power in range(len(result) - 1, -1, -1):
+        if result[power] != 0:
+            yield term(result[power], x, power, not first, power == 0)
+            first = False
+    if first:
+        yield '0'
 
-    return res
+def expand_polynomial(expr):
+    return ''.join(iter_polynomial_terms(expr))
 
 test_data = [
     '(4x+1)^5',
@@ -1,94 +1,426 @@
-from typing import Dict, List
+import hashlib
+from functools import partial
+from types import CodeType
+from typing import Dict, Iterator, List, Tuple
 
-def decypher_tape_index(i: int):
-    num = i // 8
-    ind = i % 8
-    return num, ind
+PROGRAM_CACHE_SIZE = 128
+IO_CHUNK = 1 << 12
+
+TAPE_CHUNK = 64
 
 class Tape:
+    """ Лента из битов, упакованных по 8 в байт, растёт в обе стороны """
     def __init__(self):
-        self.tape: Dict[int, int] = {}
+        self.data = bytearray(TAPE_CHUNK)
+        # байт с номером 0 лежит в data[offset]
+        self.offset = TAPE_CHUNK // 2
+
+    def grow(self, num: int) -> int:
+        j = num + self.offset
+        if j < 0:
+            extra = max(-j, len(self.data))
+            self.data[0:0] = bytes(extra)
+            self.offset += extra
+        elif j >= len(self.data):
+            self.data.extend(bytes(max(j - len(self.data) + 1, len(self.data))))
+        return num + self.offset
+
+    def ensure(self, i: int) -> Tuple[int, int, int]:
+        """ Гарантирует хранение бита i; возвращает offset и границы хранимых битов [lo, hi) """
+        self.grow(i >> 3)
+        return self.offset, -8 * self.offset, 8 * (len(self.data) - self.offset)
+
+    def read(self, i: int) -> int:
+        j = (i >> 3) + self.offset
+        if 0 <= j < len(self.data):
+            return (self.data[j] >> (i & 7)) & 1
+        return 0
+
+    def flip(self, i: int):
+        j = (i >> 3) + self.offset
+        if not 0 <= j < len(self.data):
+            j = self.grow(i >> 3)
+        self.data[j] ^= 1 << (i & 7)
 
     def __getitem__(self, i: int):
-        num, ind = decypher_tape_index(i)
-        if num not in self.tape:
-            self.tape[num] = 0
-        return (self.tape[num] >> ind) % 2
+        return self.read(i)
 
     def __setitem__(self, i: int, val: int):
-        num, ind = decypher_tape_index(i)
-        if num not in self.tape:
-            self.tape[num] = 0
-        if val == 1:
-            self.tape[num] |= 1 << ind
-        else:
-            self.tape[num] &= ~(1 << ind)
-
-def to_binary(s: str) -> List[int]:
-    res = []
-    for c in s:
-        n = ord(c)
-        for i in range(8):
-            res.append((n >> i) % 2)
-
-    return res
-
-def read_input(data: List[int]):
-    if len(data) == 0:
-        return 0
-    return data.pop(0)
-
-# for i in range(-9, 10):
-#     print(i, decypher_tape_index(i))
-
-def convert_output(output_data: List[int]):
-    res = []
-    while len(output_data) > 0:
-        while len(output_data) < 8:
-            output_data.append(0)
-        n = 0
-        for i in range(8):
-            n += output_data.pop() << (7 - i)
-        res += chr(n)
-    return ''.join(reversed(res))
-
-def boolfuck(code, input=""):
+        if self.read(i) != val:
+            self.flip(i)
+
+BITS = [tuple((byte >> i) & 1 for i in range(8)) for byte in range(256)]
+
+def byte_chunks(source) -> Iterator:
+    """ bytes/str, файл с методом read или итератор байтов (чисел или кусков bytes) """
+    if isinstance(source, str):
+        source = source.encode('latin-1')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+    elif hasattr(source, 'read'):
+        # текстовый файл отдаёт str и заканчивается на '', а не на b''
+        while chunk := source.read(IO_CHUNK):
+            yield chunk.encode('latin-1') if isinstance(chunk, str) else chunk
+    else:
+        for chunk in source:
+            if isinstance(chunk, int):
+                yield (chunk,)
+            else:
+                yield chunk.encode('latin-1') if isinstance(chunk, str) else chunk
+
+def unpack_bits(source) -> Iterator[int]:
+    for chunk in byte_chunks(source):
+        for byte in chunk:
+            yield from BITS[byte]
+
+class BitWriter:
+    """ Копит выходные байты и отдаёт их в sink (файл с методом write или функцию) пачками по IO_CHUNK """
+    def __init__(self, sink):
+        self.write = sink.write if hasattr(sink, 'write') else sink
+        self.buffer = bytearray()
+
+    def append(self, byte: int):
+        self.buffer.append(byte)
+        if len(self.buffer) >= IO_CHUNK:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write(bytes(self.buffer))
+            self.buffer.clear()
+
+class Program:
+    def __init__(self, ops: List[str], args: List[int], positions: List[int]):
+        self.ops = ops
+        # для скобок - индекс парной скобки, для сдвигов и сканирования - шаг
+        self.args = args
+        # позиция в исходном коде, с которой начинается инструкция
+        self.positions = positions
+        # индекс инструкции сканирования -> позиция закрывающей ']' её цикла в исходном коде
+        self.scan_ends = {}
+
+# команда, аргумент, позиция в исходном коде
+Token = Tuple[str, int, int]
+
+def parse(code: str) -> List[Token]:
+    tokens = []
+    for pos, c in enumerate(code):
+        match c:
+            case '<':
+                tokens.append(('m', -1, pos))
+            case '>':
+                tokens.append(('m', 1, pos))
+            case '+' | ',' | ';' | '[' | ']':
+                tokens.append((c, 0, pos))
+    return tokens
+
+def push(out: List[Token], op: str, arg: int, pos: int):
+    last = out[-1][0] if out else None
+    if op == 'm' and last == 'm':
+        _, delta, pos = out.pop()
+        if delta + arg:
+            out.append(('m', delta + arg, pos))
+    elif op == '+' and last == '+':
+        out.pop()
+    elif op == '+' and last in ('0', '1'):
+        out[-1] = ('1' if last == '0' else '0', 0, out[-1][2])
+    elif op == '0' and last in ('+', '0', '1'):
+        # предыдущее значение ячейки всё равно затирается
+        push(out, op, arg, out.pop()[2])
+    elif op == ']' and len(out) >= 2 and out[-2][0] == '[' and last == '+':
+        pos = out[-2][2]
+        del out[-2:]
+        push(out, '0', 0, pos)
+    elif op == ']' and len(out) >= 2 and out[-2][0] == '[' and last == 'm':
+        step = out.pop()[1]
+        out[-1] = ('s', step, out[-1][2])
+    else:
+        out.append((op, arg, pos))
+
+def optimize(tokens: List[Token]) -> List[Token]:
+    """ Склеивает сдвиги, убирает парные '+', заменяет [+] на очистку ячейки и [>..] / [<..] на сканирование """
+    out = []
+    for token in tokens:
+        push(out, *token)
+    return out
+
+def link(tokens: List[Token]) -> Program:
+    ops = [op for op, _, _ in tokens]
+    args = [arg for _, arg, _ in tokens]
+    stack = []
+    for i, op in enumerate(ops):
+        if op == '[':
+            stack.append(i)
+        elif op == ']':
+            if not stack:
+                raise SyntaxError(f"Unmatched ']' at instruction {i}")
+            j = stack.pop()
+            args[i] = j
+            args[j] = i
+    if stack:
+        raise SyntaxError(f"Unmatched '[' at instruction {stack[-1]}")
+    return Program(ops, args, [pos for _, _, pos in tokens])
+
+def compile_program(code: str) -> Program:
+    program = link(optimize(parse(code)))
+    # в теле сканирования нет скобок, поэтому его цикл закрывает ближайшая ']'
+    program.scan_ends = {i: code.index(']', pos)
+                         for i, (op, pos) in enumerate(zip(program.ops, program.positions)) if op == 's'}
+    return program
+
+program_cache: Dict[str, Program] = {}
+
+def cached_program(code: str) -> Program:
+    key = hashlib.sha256(code.encode()).hexdigest()
+    program = program_cache.get(key)
+    if program is None:
+        if len(program_cache) >= PROGRAM_CACHE_SIZE:
+            del program_cache[next(iter(program_cache))]
+        program = program_cache[key] = compile_program(code)
+    return program
+
+def execute(program: Program, input=b"") -> Iterator[int]:
+    """ Выполняет программу, выдавая выходные байты по мере их заполнения (младший бит первым) """
+    ops = program.ops
+    args = program.args
     tape: Tape = Tape()
-    input_data = to_binary(input)
-    output_data = []
+    read = tape.read
+    flip = tape.flip
+    next_bit = partial(next, unpack_bits(input), 0)
+    out_byte = 0
+    out_count = 0
     p = 0
     pc = 0
-    code_size = len(code)
+    code_size = len(ops)
     while pc < code_size:
-        match code[pc]:
+        match ops[pc]:
             case '+':
-                tape[p] = 1 - tape[p]
-                pc += 1
-            case '<':
-                p -= 1
-                pc += 1
-            case '>':
-                p += 1
-                pc += 1
+                flip(p)
+            case 'm':
+                p += args[pc]
+            case ',':
+                if next_bit() != read(p):
+                    flip(p)
+            case ';':
+                out_byte |= read(p) << out_count
+                out_count += 1
+                if out_count == 8:
+                    yield out_byte
+                    out_byte = 0
+                    out_count = 0
+            case '[':
+                if not read(p):
+                    pc = args[pc]
+            case ']':
+                if read(p):
+                    pc = args[pc]
+            case '0':
+                if read(p):
+                    flip(p)
+            case '1':
+                if not read(p):
+                    flip(p)
+            case 's':
+                step = args[pc]
+                while read(p):
+                    p += step
+        pc += 1
+    if out_count:
+        yield out_byte
+
+class StepLimitExceeded(Exception):
+    def __init__(self, max_steps: int, output: bytes, profile: 'Profile'):
+        super().__init__(f'Program did not finish in {max_steps} steps')
+        self.output = output
+        self.profile = profile
+
+class Profile:
+    def __init__(self, program: Program):
+        self.program = program
+        # сколько раз выполнена каждая инструкция скомпилированной программы
+        self.counts = [0] * len(program.ops)
+        self.steps = 0
+        self.tape_min = 0
+        self.tape_max = 0
+
+    def by_position(self) -> Dict[int, int]:
+        """ Число выполнений по позициям исходного кода """
+        return {pos: n for pos, n in zip(self.program.positions, self.counts) if n}
+
+    def hottest_loops(self, limit: int = 5) -> List[Tuple[int, int, int]]:
+        """ (начало, конец в исходном коде, число итераций) для самых нагруженных циклов, включая сканирования """
+        program = self.program
+        positions = program.positions
+        loops = []
+        for i, (op, n) in enumerate(zip(program.ops, self.counts)):
+            if op == ']' and n:
+                loops.append((positions[program.args[i]], positions[i], n))
+            elif op == 's' and n:
+                loops.append((positions[i], program.scan_ends.get(i, positions[i]), n))
+        return sorted(loops, key=lambda loop: -loop[2])[:limit]
+
+    @property
+    def tape_extent(self) -> Tuple[int, int]:
+        return self.tape_min, self.tape_max
+
+def execute_profiled(program: Program, profile: Profile, input=b"", max_steps: int = None) -> Iterator[int]:
+    """ То же, что execute, но со счётчиками инструкций и ограничением на число шагов """
+    ops = program.ops
+    args = program.args
+    counts = profile.counts
+    tape: Tape = Tape()
+    read = tape.read
+    flip = tape.flip
+    next_bit = partial(next, unpack_bits(input), 0)
+    output = bytearray()
+    out_byte = 0
+    out_count = 0
+    p = 0
+    p_min = p_max = 0
+    steps = 0
+    limit = max_steps if max_steps is not None else float('inf')
+    pc = 0
+    code_size = len(ops)
+    try:
+        while pc < code_size:
+            counts[pc] += 1
+            steps += 1
+            if steps > limit:
+                raise StepLimitExceeded(max_steps, bytes(output), profile)
+            match ops[pc]:
+                case '+':
+                    flip(p)
+                case 'm':
+                    p += args[pc]
+                    p_min = min(p_min, p)
+                    p_max = max(p_max, p)
+                case ',':
+                    if next_bit() != read(p):
+                        flip(p)
+                case ';':
+                    out_byte |= read(p) << out_count
+                    out_count += 1
+                    if out_count == 8:
+                        output.append(out_byte)
+                        yield out_byte
+                        out_byte = 0
+                        out_count = 0
+                case '[':
+                    if not read(p):
+                        pc = args[pc]
+                case ']':
+                    if read(p):
+                        pc = args[pc]
+                case '0':
+                    if read(p):
+                        flip(p)
+                case '1':
+                    if not read(p):
+                        flip(p)
+                case 's':
+                    step = args[pc]
+                    while read(p):
+                        p += step
+                        # итерации сканирования считаются за ним самим, как и в steps
+                        counts[pc] += 1
+                        steps += 1
+                        if steps > limit:
+                            raise StepLimitExceeded(max_steps, bytes(output), profile)
+                    p_min = min(p_min, p)
+                    p_max = max(p_max, p)
+            pc += 1
+        if out_count:
+            yield out_byte
+    finally:
+        profile.steps = steps
+        profile.tape_min = p_min
+        profile.tape_max = p_max
+
+def transpile(program: Program) -> str:
+    """ Python-исходник генератора, выполняющего программу: циклы становятся while, выход - yield """
+    lines = ['def program(tape, next_bit):',
+             '    data = tape.data',
+             '    ensure = tape.ensure',
+             '    p = 0',
+             '    off, lo, hi = ensure(p)',
+             '    out_byte = 0',
+             '    out_count = 0']
+    # после каждого сдвига p остаётся внутри хранимой части ленты, поэтому доступ к битам без проверок
+    bit = 'data[(p >> 3) + off] >> (p & 7) & 1'
+    flip = 'data[(p >> 3) + off] ^= 1 << (p & 7)'
+    ensure = 'if not lo <= p < hi: off, lo, hi = ensure(p)'
+    indent = '    '
+    for op, arg in zip(program.ops, program.args):
+        match op:
+            case '+':
+                lines.append(f'{indent}{flip}')
+            case 'm':
+                lines.append(f'{indent}p += {arg}' if arg > 0 else f'{indent}p -= {-arg}')
+                lines.append(f'{indent}{ensure}')
             case ',':
-                tape[p] = read_input(input_data)
-                pc += 1
+                lines.append(f'{indent}if next_bit() != {bit}: {flip}')
             case ';':
-                output_data.append(tape[p])
-                pc += 1
+                lines.append(f'{indent}out_byte |= ({bit}) << out_count')
+                lines.append(f'{indent}out_count += 1')
+                lines.append(f'{indent}if out_count == 8:')
+                lines.append(f'{indent}    yield out_byte')
+                lines.append(f'{indent}    out_byte = 0')
+                lines.append(f'{indent}    out_count = 0')
             case '[':
-                if tape[p] == 0:
-                    while pc < code_size and code[pc] != ']':
-                        pc += 1
-                else:
-                    pc += 1
+                lines.append(f'{indent}while {bit}:')
+                indent += '    '
+                lines.append(f'{indent}pass')
             case ']':
-                if tape[p] == 1:
-                    while pc >= 0 and code[pc] != '[':
-                        pc -= 1
-                else:
-                    pc += 1
-    output = convert_output(output_data)
-    return output
+                indent = indent[:-4]
+            case '0':
+                lines.append(f'{indent}if {bit}: {flip}')
+            case '1':
+                lines.append(f'{indent}if not {bit}: {flip}')
+            case 's':
+                lines.append(f'{indent}while {bit}:')
+                lines.append(f'{indent}    p += {arg}')
+                lines.append(f'{indent}    {ensure}')
+    lines.append('    if out_count:')
+    lines.append('        yield out_byte')
+    return '\n'.join(lines) + '\n'
+
+code_cache: Dict[str, CodeType] = {}
+
+def compile_to_python(code: str) -> CodeType:
+    key = hashlib.sha256(code.encode()).hexdigest()
+    compiled = code_cache.get(key)
+    if compiled is None:
+        if len(code_cache) >= PROGRAM_CACHE_SIZE:
+            del code_cache[next(iter(code_cache))]
+        compiled = code_cache[key] = compile(transpile(cached_program(code)), f'<boolfuck {key[:12]}>', 'exec')
+    return compiled
+
+def execute_compiled(code: str, input=b"") -> Iterator[int]:
+    namespace = {}
+    exec(compile_to_python(code), namespace)
+    return namespace['program'](Tape(), partial(next, unpack_bits(input), 0))
+
+def iter_output(code, input=b"", compiled=True) -> Iterator[int]:
+    if compiled:
+        try:
+            return execute_compiled(code, input)
+        except SyntaxError:
+            # CPython ограничивает вложенность блоков, такие программы выполняет интерпретатор
+            pass
+    return execute(cached_program(code), input)
+
+def run(code, output, input=b"", compiled=True):
+    writer = BitWriter(output)
+    for byte in iter_output(code, input, compiled):
+        writer.append(byte)
+    writer.flush()
+
+def boolfuck(code, input="", compiled=True, profile=False, max_steps=None):
+    if not profile and max_steps is None:
+        return bytes(iter_output(code, input, compiled)).decode('latin-1')
+    program = cached_program(code)
+    stats = Profile(program)
+    output = bytes(execute_profiled(program, stats, input, max_steps)).decode('latin-1')
+    return (output, stats) if profile else output
 
 print(boolfuck(';;;+;+;;+;+;+;+;+;+;;+;;+;;;+;;+;+;;+;;;+;;+;+;;+;+;;;;+;+;;+;;;+;;+;+;+;;;;;;;+;+;;+;;;+;+;;;+;+;;;;+;+;;+;;+;+;;+;;;+;;;+;;+;+;;+;;;+;+;;+;;+;+;+;;;;+;+;;;+;+;+;', ''))
\ No newline at end of file
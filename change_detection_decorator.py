@@ -1,7 +1,199 @@
-def change_detection(cls):
+from functools import partial
+from types import FunctionType
+from weakref import ref
+
+INIT = 'INIT'
+MOD = 'MOD'
+DEL = 'DEL'
+
+CHANGES = '_cd_changes'
+JOURNAL_CAPACITY = 1 << 16
+
+# старое значение ещё не заданного атрибута и новое значение удалённого
+MISSING = object()
+
+
+class JournalOverflowError(Exception):
+    pass
+
+
+class ChangeJournal:
+    """ Кольцевой буфер записей (экземпляр, атрибут, старое, новое) от многих объектов сразу """
+    def __init__(self, capacity=JOURNAL_CAPACITY):
+        self.capacity = capacity
+        # слабые ссылки, а не id: id собранного объекта может достаться новому, и его записи приписались бы тому
+        self.refs = [None] * capacity
+        self.names = [''] * capacity
+        self.olds = [None] * capacity
+        self.news = [None] * capacity
+        # номер следующей записи за всё время, по модулю capacity - индекс в буфере
+        self.position = 0
+
+    def record(self, obj, name, old, new):
+        i = self.position % self.capacity
+        self.refs[i] = ref(obj)
+        self.names[i] = name
+        self.olds[i] = old
+        self.news[i] = new
+        self.position += 1
+
+    def snapshot(self):
+        return self.position
+
+    def records(self, snapshot):
+        """ Записи после snapshot; записи уже собранных экземпляров пропускаются """
+        if self.position - snapshot > self.capacity:
+            raise JournalOverflowError(f'{self.position - snapshot - self.capacity} records since snapshot were overwritten')
+        for n in range(snapshot, self.position):
+            i = n % self.capacity
+            obj = self.refs[i]()
+            if obj is not None:
+                yield obj, self.names[i], self.olds[i], self.news[i]
+
+    def diff(self, snapshot, objects=None):
+        """ {id: {атрибут: (значение на момент snapshot, текущее)}} для изменённых с тех пор полей живых экземпляров """
+        ids = None if objects is None else {id(obj) for obj in objects}
+        result = {}
+        for obj, name, old, new in self.records(snapshot):
+            obj_id = id(obj)
+            if ids is not None and obj_id not in ids:
+                continue
+            fields = result.setdefault(obj_id, {})
+            fields[name] = (fields[name][0] if name in fields else old, new)
+        return result
+
+
+class TrackedAttribute:
+    """ Дескриптор данных без __get__: чтение через экземпляр идёт прямо из его __dict__ с родной скоростью,
+        перехватываются только запись и удаление. После del чтение вернёт сам дескриптор, а не AttributeError """
+    __slots__ = ('name', 'journal')
+
+    def __init__(self, name, journal=None):
+        self.name = name
+        self.journal = journal
+
+    def __set__(self, obj, value):
+        d = obj.__dict__
+        name = self.name
+        try:
+            changes = d[CHANGES]
+        except KeyError:
+            changes = d[CHANGES] = {}
+        if self.journal is not None:
+            self.journal.record(obj, name, d.get(name, MISSING), value)
+        changes[name] = MOD if name in changes else INIT
+        d[name] = value
+
+    def __delete__(self, obj):
+        d = obj.__dict__
+        if self.name not in d:
+            raise AttributeError(self.name)
+        if self.journal is not None:
+            self.journal.record(obj, self.name, d[self.name], MISSING)
+        del d[self.name]
+        d.setdefault(CHANGES, {})[self.name] = DEL
+
+
+def track(cls, name):
+    """ False, если имя уже занято в классе чем-то другим (методом, свойством) - такой атрибут не отслеживается """
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return isinstance(vars(klass)[name], TrackedAttribute)
+    setattr(cls, name, TrackedAttribute(name, cls._cd_journal))
+    return True
+
+
+def adopt_untracked(obj):
+    """ Берёт под отслеживание атрибуты, впервые записанные в __init__ в обход дескрипторов: с этого момента имя
+        отслеживается у всех экземпляров класса. Атрибуты, впервые появившиеся после __init__, не отслеживаются """
+    d = obj.__dict__
+    changes = d.setdefault(CHANGES, {})
+    journal = type(obj)._cd_journal
+    for name in [k for k in d if k != CHANGES and k not in changes]:
+        if not track(type(obj), name):
+            continue
+        changes[name] = INIT
+        if journal is not None:
+            journal.record(obj, name, MISSING, d[name])
+
+
+def get_change(self, name):
+    return self.__dict__.get(CHANGES, {}).get(name, '')
+
+
+def class_default(name):
+    def getter(cls):
+        return cls._cd_defaults[name]
+
+    def setter(cls, value):
+        # подкласс получает свою копию, чтобы не менять умолчания базового класса
+        if '_cd_defaults' not in vars(cls):
+            cls._cd_defaults = dict(cls._cd_defaults)
+        cls._cd_defaults[name] = value
+
+    return property(getter, setter)
+
+
+def rebind_class_cell(value, old, new):
+    """ Методы с super() без аргументов или __class__ держат класс в ячейке замыкания - переводим её на новый класс """
+    if isinstance(value, (staticmethod, classmethod)):
+        value = value.__func__
+    functions = (value.fget, value.fset, value.fdel) if isinstance(value, property) else (value,)
+    for function in functions:
+        while hasattr(function, '__wrapped__'):
+            function = function.__wrapped__
+        if not isinstance(function, FunctionType) or '__class__' not in function.__code__.co_freevars:
+            continue
+        cell = function.__closure__[function.__code__.co_freevars.index('__class__')]
+        if cell.cell_contents is old:
+            cell.cell_contents = new
+
+
+def change_detection(cls=None, *, journal=None):
     """ Decorator for get_change of class attributes """
-    print(dir(cls))
-    return cls
+    if cls is None:
+        return partial(change_detection, journal=journal)
+    if not cls.__dictoffset__:
+        raise TypeError(f"change_detection needs instance __dict__, add '__dict__' to {cls.__name__}.__slots__")
+    if journal is not None and not cls.__weakrefoffset__:
+        raise TypeError(f"change_detection with a journal needs weak references, add '__weakref__' to {cls.__name__}.__slots__")
+    slots = vars(cls).get('__slots__', ())
+    slots = (slots,) if isinstance(slots, str) else tuple(slots)
+    own = {name: value for name, value in vars(cls).items()
+           if not name.startswith(('__', '_cd_')) and name not in slots and not callable(value)
+           and not isinstance(value, (property, staticmethod, classmethod, TrackedAttribute))}
+
+    # чтение через класс (Struct.x) и присваивание ему обслуживает метакласс, а на месте его не сменить -
+    # класс пересоздаётся, а ячейки __class__ в методах переводятся на новый, как это делает dataclass(slots=True)
+    meta = type(f'{cls.__name__}Meta', (type(cls),), {name: class_default(name) for name in own})
+    namespace = {k: v for k, v in vars(cls).items() if k not in ('__dict__', '__weakref__') and k not in slots}
+    namespace.update({name: TrackedAttribute(name, journal) for name in own})
+    namespace['__qualname__'] = cls.__qualname__
+    namespace['_cd_defaults'] = {**getattr(cls, '_cd_defaults', {}), **own}
+    namespace['_cd_journal'] = journal
+    namespace['get_change'] = get_change
+    original_init = cls.__init__
+
+    def __init__(self, *args, **kwargs):
+        d = self.__dict__
+        if CHANGES in d:
+            # __init__ базового декорированного класса, вызванный через super()
+            original_init(self, *args, **kwargs)
+            return
+        d[CHANGES] = dict.fromkeys(type(self)._cd_defaults, INIT)
+        d.update(type(self)._cd_defaults)
+        original_init(self, *args, **kwargs)
+        adopt_untracked(self)
+        changes = d[CHANGES]
+        for name, state in changes.items():
+            if state == MOD:
+                changes[name] = INIT
+
+    namespace['__init__'] = __init__
+    new_cls = meta(cls.__name__, cls.__bases__, namespace)
+    for value in vars(cls).values():
+        rebind_class_cell(value, cls, new_cls)
+    return new_cls
 
 @change_detection
 class Struct:
@@ -13,4 +205,4 @@ a = Struct(11)
 
 print(Struct.x)
 print(a.x)
-print(a.y)
\ No newline at end of file
+print(a.y)
@@ -1,36 +1,584 @@
+import asyncio
+import atexit
+import json
+import os
+import sys
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import wraps
+from inspect import CO_VARARGS, CO_VARKEYWORDS
+from itertools import count
+from operator import itemgetter
+from time import perf_counter_ns, time
+from types import FunctionType, MethodType
+
+LOG_CAPACITY = 1 << 16
+# корзина i гистограммы - вызовы длительностью [2^(i-1), 2^i) нс
+HISTOGRAM_BUCKETS = 40
+# свободный номер инструмента sys.monitoring (0-2 и 5 заняты отладчиком, coverage, профилировщиком и оптимизатором)
+MONITORING_TOOL_ID = 4
+STREAM_BATCH_SIZE = 1024
+STREAM_INTERVAL = 0.5
+
+# буфер потоковой записи текущего потока или задачи asyncio
+context_buffer = ContextVar('debugger_buffer', default=None)
+# пользовательские метки, добавляемые к каждой записи (см. Debugger.tagged)
+context_tags = ContextVar('debugger_tags', default={})
+# repr значения может сам обращаться к отлаживаемым объектам - такие записи не пишем
+formatting = ContextVar('debugger_formatting', default=False)
+
+
+class LogOverflowError(Exception):
+    pass
+
+
+def keep_value(value, mode):
+    """ 'ref' - сама ссылка, 'repr' - строковое представление, 'weakref' - слабая ссылка (или repr, если нельзя) """
+    if mode == 'ref':
+        return value
+    if mode == 'weakref':
+        try:
+            return weakref.ref(value)
+        except TypeError:
+            pass
+    return repr(value)
+
+
+class AccessRecord:
+    __slots__ = ('action', 'cls', 'attribute', 'value')
+    KEYS = {'action': 'action', 'class': 'cls', 'attribute': 'attribute', 'value': 'value'}
+
+    def __init__(self, action, cls, attribute, value):
+        self.action = action
+        self.cls = cls
+        self.attribute = attribute
+        self.value = value
+
+    def __getitem__(self, key):
+        return getattr(self, self.KEYS[key])
+
+    def keep_values(self, mode):
+        self.value = keep_value(self.value, mode)
+
+
+class CallRecord:
+    __slots__ = ('cls', 'method', 'args', 'kwargs')
+    KEYS = {'class': 'cls', 'method': 'method', 'args': 'args', 'kwargs': 'kwargs'}
+
+    def __init__(self, cls, method, args, kwargs):
+        self.cls = cls
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+    def __getitem__(self, key):
+        return getattr(self, self.KEYS[key])
+
+    def keep_values(self, mode):
+        self.args = tuple(keep_value(arg, mode) for arg in self.args)
+        self.kwargs = {k: keep_value(v, mode) for k, v in self.kwargs.items()}
+
+
+class RingLog:
+    """ Лог фиксированного размера; overflow: 'overwrite' - вытеснять старые, 'drop' - не писать новые, 'error' - исключение """
+    def __init__(self, capacity=LOG_CAPACITY, overflow='overwrite', values='ref'):
+        if overflow not in ('overwrite', 'drop', 'error'):
+            raise ValueError(f'Unknown overflow policy {overflow}')
+        self.capacity = capacity
+        self.overflow = overflow
+        self.values = values
+        self.buffer = [None] * capacity
+        self.start = 0
+        self.size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError('log index out of range')
+        return self.buffer[(self.start + i) % self.capacity]
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.buffer[(self.start + i) % self.capacity]
+
+    def append(self, record):
+        if self.values != 'ref':
+            record.keep_values(self.values)
+        if self.size < self.capacity:
+            self.buffer[(self.start + self.size) % self.capacity] = record
+            self.size += 1
+        elif self.overflow == 'overwrite':
+            self.buffer[self.start] = record
+            self.start = (self.start + 1) % self.capacity
+            self.dropped += 1
+        elif self.overflow == 'drop':
+            self.dropped += 1
+        else:
+            raise LogOverflowError(f'Log is full ({self.capacity} records)')
+
+    def clear(self):
+        self.buffer = [None] * self.capacity
+        self.start = 0
+        self.size = 0
+        self.dropped = 0
+
+
+class AttributeStats:
+    __slots__ = ('gets', 'sets', 'calls', 'total_ns', 'max_ns', 'histogram')
+
+    def __init__(self):
+        self.gets = 0
+        self.sets = 0
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+
+class Statistics:
+    """ Счётчики по (класс, атрибут) вместо лога событий """
+    def __init__(self):
+        self.stats = {}
+
+    def entry(self, cls, name):
+        stats = self.stats.get((cls, name))
+        if stats is None:
+            stats = self.stats[(cls, name)] = AttributeStats()
+        return stats
+
+    def add_get(self, cls, name):
+        self.entry(cls, name).gets += 1
+
+    def add_set(self, cls, name):
+        self.entry(cls, name).sets += 1
+
+    def add_call(self, cls, name, duration_ns):
+        stats = self.entry(cls, name)
+        stats.calls += 1
+        stats.total_ns += duration_ns
+        if duration_ns > stats.max_ns:
+            stats.max_ns = duration_ns
+        stats.histogram[min(duration_ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def report(self):
+        """ Строки по убыванию суммарного времени вызовов, затем по числу обращений """
+        rows = [{
+            'class': cls,
+            'attribute': name,
+            'gets': s.gets,
+            'sets': s.sets,
+            'calls': s.calls,
+            'total_ns': s.total_ns,
+            'max_ns': s.max_ns,
+            'mean_ns': s.total_ns // s.calls if s.calls else 0,
+            'histogram': list(s.histogram)
+        } for (cls, name), s in self.stats.items()]
+        return sorted(rows, key=lambda row: (-row['total_ns'], -(row['gets'] + row['sets'] + row['calls'])))
+
+
+def frame_arguments(frame):
+    """ Аргументы вызова, восстановленные из локальных переменных кадра в момент его старта """
+    code = frame.f_code
+    names = code.co_varnames
+    local = frame.f_locals
+    count = code.co_argcount
+    kwonly = code.co_kwonlyargcount
+    args = tuple(local[name] for name in names[:count])
+    kwargs = {name: local[name] for name in names[count:count + kwonly]}
+    i = count + kwonly
+    if code.co_flags & CO_VARARGS:
+        args += local[names[i]]
+        i += 1
+    if code.co_flags & CO_VARKEYWORDS:
+        kwargs.update(local[names[i]])
+    return args, kwargs
+
+
+def class_functions(cls):
+    for value in vars(cls).values():
+        if isinstance(value, (staticmethod, classmethod)):
+            value = value.__func__
+        if isinstance(value, FunctionType):
+            yield value
+
+
+class MonitoringBackend:
+    """ Пишет вызовы методов выбранных классов через sys.monitoring (Python 3.12+), без Meta и обёрток """
+    def __init__(self, tool_id=MONITORING_TOOL_ID):
+        if not hasattr(sys, 'monitoring'):
+            raise RuntimeError('sys.monitoring requires Python 3.12+')
+        self.monitoring = sys.monitoring
+        self.tool_id = tool_id
+        # code-объект метода -> класс, которому он принадлежит
+        self.codes = {}
+        self.starts = threading.local()
+        events = self.monitoring.events
+        self.monitoring.use_tool_id(tool_id, 'debugger')
+        self.monitoring.register_callback(tool_id, events.PY_START, self.on_start)
+        self.monitoring.register_callback(tool_id, events.PY_RETURN, self.on_return)
+        self.monitoring.register_callback(tool_id, events.PY_UNWIND, self.on_unwind)
+
+    def enable(self, cls):
+        events = self.monitoring.events
+        for function in class_functions(cls):
+            self.codes[function.__code__] = cls
+            self.monitoring.set_local_events(self.tool_id, function.__code__, events.PY_START | events.PY_RETURN)
+        # PY_UNWIND нельзя включить для отдельного code-объекта, только глобально; чужие кадры отсеивает on_unwind
+        self.monitoring.set_events(self.tool_id, events.PY_UNWIND if self.codes else 0)
+
+    def disable(self, cls):
+        for function in class_functions(cls):
+            if self.codes.pop(function.__code__, None) is not None:
+                self.monitoring.set_local_events(self.tool_id, function.__code__, 0)
+        if not self.codes:
+            self.monitoring.set_events(self.tool_id, 0)
+
+    def close(self):
+        for code in self.codes:
+            self.monitoring.set_local_events(self.tool_id, code, 0)
+        self.codes.clear()
+        self.monitoring.set_events(self.tool_id, 0)
+        self.monitoring.free_tool_id(self.tool_id)
+
+    def on_start(self, code, instruction_offset):
+        cls = self.codes.get(code)
+        if cls is None:
+            return
+        if Debugger.statistics is not None:
+            self.starts.__dict__.setdefault('stack', []).append((code, perf_counter_ns()))
+            return
+        args, kwargs = frame_arguments(sys._getframe(1))
+        Debugger.log_call(cls, code.co_name, args, kwargs)
+
+    def on_return(self, code, instruction_offset, retval):
+        self.finish(code)
+
+    def on_unwind(self, code, instruction_offset, exception):
+        # вызов, завершившийся исключением, тоже считается, как и в try/finally у Meta
+        self.finish(code)
+
+    def finish(self, code):
+        cls = self.codes.get(code)
+        stack = self.starts.__dict__.get('stack')
+        if cls is None or Debugger.statistics is None or not stack:
+            return
+        # записи, оставшиеся выше, принадлежат кадрам, начатым до включения статистики
+        while stack:
+            started_code, start = stack.pop()
+            if started_code is code:
+                Debugger.statistics.add_call(cls, code.co_name, perf_counter_ns() - start)
+                return
+
+
+def current_task():
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+@contextmanager
+def tagged(**tags):
+    token = context_tags.set({**context_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        context_tags.reset(token)
+
+
+class ContextBuffer:
+    __slots__ = ('log', 'thread', 'task', 'records')
+
+    def __init__(self, log, thread, task):
+        self.log = log
+        self.thread = thread
+        self.task = task
+        # append и popleft у deque атомарны: владелец пишет, поток сброса забирает без блокировок
+        self.records = deque()
+
+    def alive(self):
+        return not self.task.done() if self.task is not None else self.thread.is_alive()
+
+
+class StreamLog:
+    """ Записи копятся в буферах отдельных потоков и задач asyncio, фоновый поток пачками пишет их в JSONL-файл или callback """
+    def __init__(self, sink, batch_size=STREAM_BATCH_SIZE, interval=STREAM_INTERVAL):
+        self.owns_sink = isinstance(sink, (str, os.PathLike))
+        self.sink = open(sink, 'a', encoding='utf-8') if self.owns_sink else sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buffers = []
+        self.sequence = count()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.error = None
+        self.flusher = threading.Thread(target=self.run, name='debugger-stream', daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    def buffer(self):
+        thread = threading.current_thread()
+        task = current_task()
+        buffer = context_buffer.get()
+        # задача наследует контекст создателя вместе с его буфером - заводим свой
+        if buffer is None or buffer.log is not self or buffer.thread is not thread or buffer.task is not task:
+            buffer = ContextBuffer(self, thread, task)
+            with self.lock:
+                self.buffers.append(buffer)
+            context_buffer.set(buffer)
+        return buffer
+
+    def append(self, record):
+        buffer = self.buffer()
+        record['seq'] = next(self.sequence)
+        record['time'] = time()
+        record['thread'] = buffer.thread.name
+        record['task'] = buffer.task.get_name() if buffer.task is not None else None
+        tags = context_tags.get()
+        if tags:
+            record['tags'] = tags
+        buffer.records.append(record)
+        if len(buffer.records) >= self.batch_size:
+            self.wakeup.set()
+
+    def log_access(self, action, cls, attribute, value):
+        if formatting.get():
+            return
+        token = formatting.set(True)
+        try:
+            record = {'action': action, 'class': cls.__qualname__, 'attribute': attribute, 'value': repr(value)}
+        finally:
+            formatting.reset(token)
+        self.append(record)
+
+    def log_call(self, cls, method, args, kwargs):
+        if formatting.get():
+            return
+        token = formatting.set(True)
+        try:
+            record = {'action': 'call', 'class': cls.__qualname__, 'method': method,
+                      'args': [repr(arg) for arg in args], 'kwargs': {k: repr(v) for k, v in kwargs.items()}}
+        finally:
+            formatting.reset(token)
+        self.append(record)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                buffers = list(self.buffers)
+            batch = []
+            for buffer in buffers:
+                records = buffer.records
+                while records:
+                    batch.append(records.popleft())
+            with self.lock:
+                # завершившийся владелец уже ничего не допишет - его пустой буфер больше не нужен
+                self.buffers = [b for b in self.buffers if b.alive() or b.records]
+            if batch:
+                batch.sort(key=itemgetter('seq'))
+                self.write(batch)
+
+    def write(self, batch):
+        if callable(self.sink):
+            self.sink(batch)
+        else:
+            self.sink.write(''.join(json.dumps(record, default=repr) + '\n' for record in batch))
+            self.sink.flush()
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # ошибку приёмника отдаём из close(), поток сброса продолжает работать
+                self.error = e
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        self.wakeup.set()
+        if self.flusher is not threading.current_thread():
+            self.flusher.join()
+        try:
+            self.flush()
+        finally:
+            if self.owns_sink:
+                self.sink.close()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+def access_dict(action, cls, attribute, value):
+    return {
+        'action': action,
+        'class': cls,
+        'attribute': attribute,
+        'value': value
+    }
+
+
+def call_dict(cls, method, args, kwargs):
+    return {
+        'class': cls,
+        'method': method,
+        'args': args,
+        'kwargs': kwargs
+    }
 
 
 class Debugger(object):
     attribute_accesses = []
     method_calls = []
+    access_record = staticmethod(access_dict)
+    call_record = staticmethod(call_dict)
+    statistics = None
+    monitoring = None
+    stream = None
+    tagged = staticmethod(tagged)
+
+    @staticmethod
+    def use_ring_buffer(capacity=LOG_CAPACITY, overflow='overwrite', values='ref'):
+        Debugger.attribute_accesses = RingLog(capacity, overflow, values)
+        Debugger.method_calls = RingLog(capacity, overflow, values)
+        Debugger.access_record = staticmethod(AccessRecord)
+        Debugger.call_record = staticmethod(CallRecord)
+
+    @staticmethod
+    def monitor(cls):
+        if Debugger.monitoring is None:
+            Debugger.monitoring = MonitoringBackend()
+        Debugger.monitoring.enable(cls)
+        return cls
+
+    @staticmethod
+    def unmonitor(cls):
+        if Debugger.monitoring is not None:
+            Debugger.monitoring.disable(cls)
+        return cls
+
+    @staticmethod
+    def use_statistics():
+        Debugger.statistics = Statistics()
+
+    @staticmethod
+    def use_stream(sink, batch_size=STREAM_BATCH_SIZE, interval=STREAM_INTERVAL):
+        """ sink - путь к JSONL-файлу, открытый текстовый файл или callback, получающий список записей """
+        Debugger.close_stream()
+        Debugger.stream = StreamLog(sink, batch_size, interval)
+
+    @staticmethod
+    def flush():
+        if Debugger.stream is not None:
+            Debugger.stream.flush()
+
+    @staticmethod
+    def close_stream():
+        stream, Debugger.stream = Debugger.stream, None
+        if stream is not None:
+            stream.close()
+
+    @staticmethod
+    def report():
+        return Debugger.statistics.report() if Debugger.statistics is not None else []
 
     @staticmethod
     def log_getattr(cls, attr_name, value):
-        Debugger.attribute_accesses.append({
-            'action': 'get',
-            'class': cls,
-            'attribute': attr_name,
-            'value': value
-        })
+        if Debugger.statistics is not None:
+            Debugger.statistics.add_get(cls, attr_name)
+            return
+        if Debugger.stream is not None:
+            Debugger.stream.log_access('get', cls, attr_name, value)
+            return
+        Debugger.attribute_accesses.append(Debugger.access_record('get', cls, attr_name, value))
 
     @staticmethod
     def log_setattr(cls, attr_name, value):
-        Debugger.attribute_accesses.append({
-            'action': 'set',
-            'class': cls,
-            'attribute': attr_name,
-            'value': value
-        })
+        if Debugger.statistics is not None:
+            Debugger.statistics.add_set(cls, attr_name)
+            return
+        if Debugger.stream is not None:
+            Debugger.stream.log_access('set', cls, attr_name, value)
+            return
+        Debugger.attribute_accesses.append(Debugger.access_record('set', cls, attr_name, value))
 
     @staticmethod
     def log_call(cls, method_name, args, kwargs):
-        Debugger.method_calls.append({
-            'class': cls,
-            'method': method_name,
-            'args': args,
-            'kwargs': kwargs
-        })
+        if Debugger.stream is not None:
+            Debugger.stream.log_call(cls, method_name, args, kwargs)
+            return
+        Debugger.method_calls.append(Debugger.call_record(cls, method_name, args, kwargs))
+
+    @staticmethod
+    def call(cls, method_name, real_args, function, args, kwargs):
+        statistics = Debugger.statistics
+        if statistics is None:
+            Debugger.log_call(cls, method_name, real_args, kwargs)
+            return function(*args, **kwargs)
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            statistics.add_call(cls, method_name, perf_counter_ns() - start)
+
+
+# id(экземпляра) -> (слабая ссылка на него, {имя: (функция, объект привязки, обёртка)})
+wrapper_cache = {}
+
+
+def instance_wrappers(obj):
+    """ Кэш обёрток методов экземпляра; None, если на экземпляр нельзя завести слабую ссылку """
+    key = id(obj)
+    entry = wrapper_cache.get(key)
+    if entry is not None and entry[0]() is obj:
+        return entry[1]
+
+    def forget(ref):
+        if wrapper_cache.get(key, (None,))[0] is ref:
+            del wrapper_cache[key]
+
+    try:
+        ref = weakref.ref(obj, forget)
+    except TypeError:
+        return None
+    wrappers = {}
+    wrapper_cache[key] = (ref, wrappers)
+    return wrappers
+
+
+def make_wrapper(cls, obj, value):
+    """ Обёртка принимает экземпляр первым аргументом и привязывается к нему через MethodType при чтении:
+        сильную ссылку держит только вызывающий, а не кэш, иначе кэш не даст экземпляру умереть """
+    if isinstance(value, MethodType) and value.__self__ is obj:
+        func = value.__func__
+
+        # wraps(value) сохранил бы связанный метод в __wrapped__ и с ним сильную ссылку на экземпляр
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            real_args = (self,) + args
+            return Debugger.call(cls, func.__name__, real_args, func, real_args, kwargs)
+    else:
+        @wraps(value)
+        def wrapper(self, *args, **kwargs):
+            return Debugger.call(cls, value.__name__, (self,) + args, value, args, kwargs)
+
+    return wrapper
 
 
 class Meta(type):
@@ -42,13 +590,23 @@ class Meta(type):
             Debugger.log_getattr(new_class, name, value)
 
             if callable(value):
-                @wraps(value)
-                def wrapper(*args, **kwargs):
-                    real_args = tuple([self] + list(args))
-                    Debugger.log_call(new_class, value.__name__, real_args, kwargs)
-                    return value(*args, **kwargs)
+                wrappers = instance_wrappers(self)
+                if wrappers is None:
+                    @wraps(value)
+                    def wrapper(*args, **kwargs):
+                        real_args = tuple([self] + list(args))
+                        return Debugger.call(new_class, value.__name__, real_args, value, args, kwargs)
 
-                return wrapper
+                    return wrapper
+                func = getattr(value, '__func__', value)
+                # метод, привязанный к другому объекту (f.cb = a.who), одной функцией не опознать
+                bound = getattr(value, '__self__', None)
+                if bound is self:
+                    bound = None
+                cached = wrappers.get(name)
+                if cached is None or cached[0] is not func or cached[1] is not bound:
+                    cached = wrappers[name] = (func, bound, make_wrapper(new_class, self, value))
+                return MethodType(cached[2], self)
             else:
                 return value
 
@@ -62,6 +620,13 @@ class Meta(type):
         return new_class
 
     def __call__(cls, *args, **kwargs):
+        statistics = Debugger.statistics
+        if statistics is not None:
+            start = perf_counter_ns()
+            instance = super().__call__(*args, **kwargs)
+            statistics.add_call(cls, '__init__', perf_counter_ns() - start)
+            return instance
+
         instance = super().__call__(*args, **kwargs)
         real_args = tuple([instance] + list(args))
         Debugger.log_call(cls, '__init__', real_args, kwargs)
@@ -1,41 +1,702 @@
-from collections import defaultdict
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import compress
+from math import gcd, isqrt, log
+from operator import not_
+from typing import Iterable, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+WHEEL = 30
+WHEEL_PRIMES = (2, 3, 5)
+RESIDUES = (1, 7, 11, 13, 17, 19, 23, 29)
+RESIDUE_INDEX = [RESIDUES.index(r) if r in RESIDUES else -1 for r in range(WHEEL)]
+# для каждого остатка q по модулю 30 - сдвиги до следующих 8 чисел, взаимно простых с 30
+WHEEL_STEPS = [tuple(d for d in range(WHEEL) if RESIDUE_INDEX[(r + d) % WHEEL] >= 0) for r in range(WHEEL)]
+
+SEGMENT_BLOCKS = 1 << 15
+SEGMENT_SPAN = WHEEL * SEGMENT_BLOCKS
+SEGMENT_OFFSETS = array('I', (WHEEL * k + r for k in range(SEGMENT_BLOCKS) for r in RESIDUES))
+OFFSETS_VIEW = memoryview(SEGMENT_OFFSETS)
+ZEROS = memoryview(bytes(len(RESIDUES) * SEGMENT_BLOCKS))
+
+
+def small_primes(limit: int) -> list:
+    if limit < 2:
+        return []
+    sieve = bytearray(b'\x01') * (limit // 2 + 1)
+    sieve[0] = 0
+    for i in range(1, isqrt(limit) // 2 + 1):
+        if sieve[i]:
+            p = 2 * i + 1
+            start = p * p // 2
+            sieve[start::p] = bytes(len(range(start, len(sieve), p)))
+    primes = [2]
+    primes.extend(2 * i + 1 for i in compress(range(len(sieve)), sieve) if 2 * i + 1 <= limit)
+    return primes
+
+
+def sieve_segment(lo: int, base_primes: list, blocks: int = SEGMENT_BLOCKS) -> bytearray:
+    """ Сегмент [lo, lo + 30 * blocks), lo кратно 30; байт i отвечает числу lo + SEGMENT_OFFSETS[i] """
+    size = len(RESIDUES) * blocks
+    hi = lo + WHEEL * blocks
+    seg = bytearray(b'\x01') * size
+    if lo == 0:
+        seg[0] = 0
+    for p in base_primes:
+        if p < 7:
+            continue
+        if p * p >= hi:
+            break
+        q0 = max(p, -(-lo // p))
+        step = len(RESIDUES) * p
+        for d in WHEEL_STEPS[q0 % WHEEL]:
+            m = p * (q0 + d)
+            if m >= hi:
+                break
+            i = len(RESIDUES) * ((m - lo) // WHEEL) + RESIDUE_INDEX[m % WHEEL]
+            seg[i::step] = ZEROS[:(size - 1 - i) // step + 1]
+    return seg
+
+
+def segment_primes(lo: int, seg: bytearray):
+    return map(lo.__add__, compress(SEGMENT_OFFSETS, seg))
+
+
+class SegmentedSieve:
+    def __init__(self, lo: int = 0, blocks: int = SEGMENT_BLOCKS):
+        if blocks > SEGMENT_BLOCKS:
+            raise ValueError(f"Segment can't be longer than {SEGMENT_BLOCKS} blocks")
+        self.lo = lo - lo % WHEEL
+        self.blocks = blocks
+        self.base_primes = []
+        self.base_limit = 1
+
+    def ensure_base(self, hi: int):
+        limit = isqrt(hi)
+        if limit > self.base_limit:
+            self.base_limit = max(limit, 2 * self.base_limit)
+            self.base_primes = small_primes(self.base_limit)
+
+    def next_segment(self):
+        lo = self.lo
+        hi = lo + WHEEL * self.blocks
+        self.ensure_base(hi)
+        seg = sieve_segment(lo, self.base_primes, self.blocks)
+        self.lo = hi
+        return lo, seg
+
+    def __iter__(self):
+        if self.lo == 0:
+            yield from WHEEL_PRIMES
+        while True:
+            yield from segment_primes(*self.next_segment())
+
+
+def sieve_range(lo: int, hi: int, base_primes=None) -> array:
+    """ Все простые из [lo, hi) одним массивом array('Q') """
+    lo = max(lo, 0)
+    if base_primes is None:
+        base_primes = small_primes(isqrt(hi))
+    out = array('Q', (p for p in WHEEL_PRIMES if lo <= p < hi))
+    seg_lo = lo - lo % WHEEL
+    while seg_lo < hi:
+        blocks = min(SEGMENT_BLOCKS, -(-(hi - seg_lo) // WHEEL))
+        seg = sieve_segment(seg_lo, base_primes, blocks)
+        a = bisect_left(SEGMENT_OFFSETS, lo - seg_lo, 0, len(seg)) if seg_lo < lo else 0
+        b = bisect_left(SEGMENT_OFFSETS, hi - seg_lo, 0, len(seg))
+        out.extend(map(seg_lo.__add__, compress(OFFSETS_VIEW[a:b], memoryview(seg)[a:b])))
+        seg_lo += WHEEL * blocks
+    return out
+
+
+PARALLEL_TASK_SPAN = 8 * SEGMENT_SPAN
+
+# базовые простые внутри процесса-воркера
+worker_base_primes = array('I')
+
+
+def init_worker(base_primes: array):
+    global worker_base_primes
+    worker_base_primes = base_primes
+
+
+def sieve_task(bounds: Tuple[int, int]) -> array:
+    global worker_base_primes
+    lo, hi = bounds
+    limit = isqrt(hi)
+    known = worker_base_primes[-1] if worker_base_primes else 0
+    if known < limit:
+        worker_base_primes = array('I', small_primes(max(limit, 2 * known)))
+    return sieve_range(lo, hi, worker_base_primes)
+
+
+def parallel_tasks(lo: int, hi: int):
+    for task_lo in range(lo, hi, PARALLEL_TASK_SPAN):
+        yield task_lo, min(task_lo + PARALLEL_TASK_SPAN, hi)
+
+
+def parallel_sieve_range(lo: int, hi: int, workers: int) -> array:
+    base_primes = array('I', small_primes(isqrt(hi)))
+    out = array('Q')
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(base_primes,)) as pool:
+        for part in pool.map(sieve_task, parallel_tasks(max(lo, 0), hi)):
+            out.extend(part)
+    return out
+
+
+def parallel_stream(lo: int, workers: int):
+    """ Бесконечный поток простых от lo, сегменты просеиваются пулом процессов с опережением """
+    pool = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(array('I'),))
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < 2 * workers:
+                pending.append(pool.submit(sieve_task, (lo, lo + PARALLEL_TASK_SPAN)))
+                lo += PARALLEL_TASK_SPAN
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def nth_prime_bound(n: int) -> int:
+    """ Верхняя оценка n-го простого (нумерация с 1) """
+    if n < 6:
+        return 13
+    return int(n * (log(n) + log(log(n)))) + 1
+
+
+def nth_prime_estimate(n: int) -> int:
+    if n < 6:
+        return (2, 3, 5, 7, 11)[n - 1]
+    ln = log(n)
+    lnln = log(ln)
+    return int(n * (ln + lnln - 1 + (lnln - 2) / ln))
+
+
+def prime_count_lists(x: int) -> int:
+    r = isqrt(x)
+    # small[v] - количество "выживших" чисел в [2, v], large[i] - то же для x // i
+    small = [v - 1 for v in range(r + 1)]
+    large = [0] + [x // i - 1 for i in range(1, r + 1)]
+    for p in small_primes(r):
+        pc = small[p - 1]
+        p2 = p * p
+        for i in range(1, min(r, x // p2) + 1):
+            d = i * p
+            large[i] -= (large[d] if d <= r else small[x // d]) - pc
+        for v in range(r, p2 - 1, -1):
+            small[v] -= small[v // p] - pc
+    return large[1]
+
+
+def prime_count_numpy(x: int) -> int:
+    r = isqrt(x)
+    # все различные значения x // i по убыванию
+    values = np.concatenate((x // np.arange(1, r + 1, dtype=np.int64),
+                             np.arange(x // r - 1, 0, -1, dtype=np.int64)))
+    size = len(values)
+    border = x // r
+    counts = values - 1
+    ascending = -values
+
+    def index(v):
+        return np.where(v >= border, x // np.maximum(v, 1) - 1, size - v)
+
+    for p in small_primes(r):
+        pc = counts[size - (p - 1)] if p - 1 < border else counts[x // (p - 1) - 1]
+        k = int(np.searchsorted(ascending, -p * p, side='right'))
+        counts[:k] -= counts[index(values[:k] // p)] - pc
+    return int(counts[0])
+
+
+def prime_count(x: int) -> int:
+    """ pi(x) методом Lucy_Hedgehog за O(x^(3/4)) """
+    if x < 2:
+        return 0
+    if np is not None and x < 1 << 62:
+        return prime_count_numpy(x)
+    return prime_count_lists(x)
+
+
+def nth_prime(n: int, window: int = SEGMENT_SPAN) -> int:
+    """ n-е простое: pi(x) в точке оценки и досеивание окнами до нужного номера """
+    if n < 1:
+        raise ValueError('Primes are numbered from 1')
+    x = nth_prime_estimate(n)
+    count = prime_count(x)
+    if count >= n:
+        hi = x + 1
+        while True:
+            lo = max(hi - window, 0)
+            primes = sieve_range(lo, hi)
+            if count - len(primes) < n:
+                return primes[n - (count - len(primes)) - 1]
+            count -= len(primes)
+            hi = lo
+    lo = x + 1
+    while True:
+        primes = sieve_range(lo, lo + window)
+        if count + len(primes) >= n:
+            return primes[n - count - 1]
+        count += len(primes)
+        lo += window
+
+
+def as_output(primes: array):
+    return np.frombuffer(primes, dtype=np.uint64) if np is not None else primes
+
+
+TRIAL_PRIMES = tuple(small_primes(100))
+# первые 13 простых (до 41) как основания дают детерминированный ответ для n < psi_13 = 3317044064679887385961981;
+# 12 оснований (до 37) ошибаются уже на psi_12 = 318665857834031151167461 = 399165290221 * 798330580441
+MILLER_RABIN_BASES = TRIAL_PRIMES[:13]
+MILLER_RABIN_LIMIT = 3317044064679887385961981
+
+
+def strong_probable_prime(n: int, a: int, d: int, s: int) -> bool:
+    """ n - 1 = d * 2^s, d нечётно """
+    x = pow(a, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+def jacobi(a: int, n: int) -> int:
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def strong_lucas_probable_prime(n: int) -> bool:
+    """ Сильный тест Люка с параметрами Селфриджа: первое D из 5, -7, 9, -11, ... с (D/n) = -1, P = 1, Q = (1 - D) / 4 """
+    if isqrt(n) ** 2 == n:
+        return False
+    D = 5
+    while True:
+        j = jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    Q = (1 - D) // 4
+    d = n + 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+
+    def half(x):
+        return (x + n if x & 1 else x) // 2 % n
+
+    # U_k, V_k, Q^k для k - префикса двоичной записи d
+    U, V, Qk = 1, 1, Q % n
+    for bit in bin(d)[3:]:
+        U, V, Qk = U * V % n, (V * V - 2 * Qk) % n, Qk * Qk % n
+        if bit == '1':
+            U, V, Qk = half(U + V), half(D * U + V), Qk * Q % n
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s - 1):
+        V, Qk = (V * V - 2 * Qk) % n, Qk * Qk % n
+        if V == 0:
+            return True
+    return False
+
+
+def is_prime(n: int) -> bool:
+    """ Проверка без состояния: пробное деление на малые простые, затем детерминированный Миллер-Рабин,
+        а за его пределом - Baillie-PSW (контрпримеры не известны, но и не доказано, что их нет) """
+    if n < 2:
+        return False
+    for p in TRIAL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < 101 * 101:
+        return True
+    d = n - 1
+    s = (d & -d).bit_length() - 1
+    d >>= s
+    if n < MILLER_RABIN_LIMIT:
+        return all(strong_probable_prime(n, a, d, s) for a in MILLER_RABIN_BASES)
+    return strong_probable_prime(n, 2, d, s) and strong_lucas_probable_prime(n)
+
+
+LPF_WINDOW = 1 << 16
+LPF_TABLE_LIMIT = 1 << 24
+
+
+def least_factor_window(lo: int, hi: int, base_primes: list) -> array:
+    """ Наименьшие простые делители чисел [lo, hi), 0 - для простых (и для 0, 1) """
+    lp = array('I', bytes(4 * (hi - lo)))
+    # идём от больших простых к меньшим, чтобы наименьший делитель записался последним
+    for p in reversed([p for p in base_primes if p * p < hi]):
+        start = max(p * p, -(-lo // p) * p) - lo
+        lp[start::p] = array('I', [p]) * len(range(start, hi - lo, p))
+    return lp
+
+
+def window_primes(lo: int, lp: array):
+    if lo < 2:
+        return compress(range(lo, lo + len(lp)), (n >= 2 and not f for n, f in enumerate(lp, lo)))
+    return compress(range(lo, lo + len(lp)), map(not_, lp))
+
+
+class LeastFactorSieve:
+    """ Поток простых из окон таблицы наименьших делителей, пройденные окна не хранятся """
+    def __init__(self, lo: int = 0, window: int = LPF_WINDOW):
+        self.lo = lo
+        self.window = window
+        self.base_primes = []
+        self.base_limit = 1
+
+    def next_window(self):
+        lo = self.lo
+        hi = lo + self.window
+        limit = isqrt(hi)
+        if limit > self.base_limit:
+            self.base_limit = max(limit, 2 * self.base_limit)
+            self.base_primes = small_primes(self.base_limit)
+        self.lo = hi
+        return lo, least_factor_window(lo, hi, self.base_primes)
+
+    def __iter__(self):
+        while True:
+            yield from window_primes(*self.next_window())
+
+
+class LeastFactorTable:
+    """ Таблица наименьших делителей для [0, limit), растёт по требованию до max_limit """
+    def __init__(self, limit: int = LPF_WINDOW, max_limit: int = LPF_TABLE_LIMIT):
+        self.max_limit = max_limit
+        self.lp = array('I')
+        self.primes = array('I')
+        self.lock = threading.Lock()
+        self.extend(limit)
+
+    def __len__(self):
+        return len(self.lp)
+
+    def extend(self, limit: int):
+        limit = min(limit, self.max_limit)
+        with self.lock:
+            lo = len(self.lp)
+            if limit <= lo:
+                return
+            window = least_factor_window(lo, limit, small_primes(isqrt(limit)))
+            self.primes.extend(window_primes(lo, window))
+            self.lp.extend(window)
+
+    def least_prime_factor(self, n: int) -> int:
+        if n < 2:
+            raise ValueError(f'{n} has no prime factors')
+        if n < len(self.lp):
+            return self.lp[n] or n
+        # таблицу не растим ради простого n - иначе она разом доходит до max_limit и остаётся в памяти
+        if is_prime(n):
+            return n
+        if n < self.max_limit:
+            self.extend(max(n + 1, 2 * len(self.lp)))
+            return self.lp[n] or n
+        for p in self.primes:
+            if p * p > n:
+                return n
+            if n % p == 0:
+                return p
+        return min(rho_factors(n))
+
+    def large_factors(self, n: int) -> List[int]:
+        """ Простые делители (с повторениями) числа за пределами таблицы: пробное деление на её простые, остаток - ро-методом """
+        factors = []
+        for p in self.primes:
+            if p * p > n:
+                break
+            while n % p == 0:
+                factors.append(p)
+                n //= p
+        if n > 1:
+            factors.extend(rho_factors(n))
+        return sorted(factors)
+
+    def factorize(self, n: int) -> List[Tuple[int, int]]:
+        factors = []
+        while n > 1:
+            if n >= self.max_limit and not is_prime(n):
+                primes = self.large_factors(n)
+                factors.extend((p, primes.count(p)) for p in sorted(set(primes)))
+                break
+            p = self.least_prime_factor(n)
+            k = 0
+            while n % p == 0:
+                n //= p
+                k += 1
+            factors.append((p, k))
+        return factors
+
+
+def pollard_brent(n: int) -> int:
+    """ Нетривиальный делитель составного n: ро-метод Полларда в варианте Брента, gcd считается пачками по 128 шагов """
+    if n % 2 == 0:
+        return 2
+    for c in range(1, n):
+        y, r, q, g = 2, 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(128, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += 128
+            r *= 2
+        if g == n:
+            # пачка проскочила делитель - повторяем её по одному шагу
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+    raise ValueError(f'{n} is prime')
+
+
+def rho_factors(n: int) -> List[int]:
+    if is_prime(n):
+        return [n]
+    d = pollard_brent(n)
+    return rho_factors(d) + rho_factors(n // d)
+
+
+PRIME_CACHE_LIMIT = 1 << 22
+CACHE_CHUNK = 1 << 16
+
+
+class PrimeCache:
+    """ Общий дописываемый кэш первых простых, из которого читают все потоки """
+    def __init__(self, capacity: int = PRIME_CACHE_LIMIT):
+        self.capacity = capacity
+        self.primes = array('Q')
+        self.frontier = 0
+        self.sieve = SegmentedSieve()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.primes)
+
+    def extend(self):
+        lo, seg = self.sieve.next_segment()
+        if lo == 0:
+            self.primes.extend(WHEEL_PRIMES)
+        self.primes.extend(segment_primes(lo, seg))
+        self.frontier = self.sieve.lo
+
+    def copy(self, start: int, stop: int) -> array:
+        return self.primes[start:stop]
+
+    def read(self, i: int, size: int = CACHE_CHUNK) -> array:
+        """ Копия простых с i-го; пустая, если кэш заполнен и i за его концом """
+        with self.lock:
+            while i >= len(self.primes) and len(self.primes) < self.capacity:
+                self.extend()
+            return self.copy(i, i + size)
+
+
+CACHE_FILE_MAGIC = b'PRIMES\0\0'
+CACHE_FILE_VERSION = 1
+# magic, версия, зарезервировано, количество простых, граница просеянного
+CACHE_FILE_HEADER = struct.Struct('<8sIIQQ')
+
+
+class PersistentPrimeCache:
+    """ Кэш простых в файле: заголовок и uint64 простые подряд, читается через mmap всеми процессами """
+    def __init__(self, path: str, capacity: int = PRIME_CACHE_LIMIT):
+        self.path = path
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        with self.file_lock(exclusive=True):
+            if os.fstat(self.file.fileno()).st_size == 0:
+                self.write_header(0, 0)
+            self.remap()
+        self.sieve = SegmentedSieve(self.frontier)
+
+    def __len__(self):
+        return len(self.primes)
+
+    @contextmanager
+    def file_lock(self, exclusive: bool = False):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def write_header(self, count: int, frontier: int):
+        self.file.seek(0)
+        self.file.write(CACHE_FILE_HEADER.pack(CACHE_FILE_MAGIC, CACHE_FILE_VERSION, 0, count, frontier))
+        self.file.flush()
+
+    def remap(self):
+        self.file.seek(0)
+        magic, version, _, count, frontier = CACHE_FILE_HEADER.unpack(self.file.read(CACHE_FILE_HEADER.size))
+        if magic != CACHE_FILE_MAGIC:
+            raise ValueError(f'{self.path} is not a prime cache file')
+        if version != CACHE_FILE_VERSION:
+            raise ValueError(f'Unsupported prime cache version {version}')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        end = CACHE_FILE_HEADER.size + 8 * count
+        self.primes = memoryview(self.map)[CACHE_FILE_HEADER.size:end].cast('Q')
+        self.frontier = frontier
+
+    def extend(self):
+        with self.file_lock(exclusive=True):
+            count = len(self.primes)
+            self.remap()
+            if len(self.primes) > count:
+                # кэш уже дописал другой процесс
+                return
+            if self.sieve.lo != self.frontier:
+                self.sieve = SegmentedSieve(self.frontier)
+            lo, seg = self.sieve.next_segment()
+            primes = array('Q', WHEEL_PRIMES if lo == 0 else ())
+            primes.extend(segment_primes(lo, seg))
+            self.file.seek(CACHE_FILE_HEADER.size + 8 * count)
+            self.file.write(primes.tobytes())
+            self.file.flush()
+            self.write_header(count + len(primes), self.sieve.lo)
+            self.remap()
+
+    def copy(self, start: int, stop: int) -> array:
+        primes = array('Q')
+        primes.frombytes(self.primes[start:stop].cast('B'))
+        return primes
+
+    def read(self, i: int, size: int = CACHE_CHUNK) -> array:
+        with self.lock:
+            if i >= len(self.primes):
+                with self.file_lock():
+                    self.remap()
+            while i >= len(self.primes) and len(self.primes) < self.capacity:
+                self.extend()
+            return self.copy(i, i + size)
+
 
 class Primes:
-    primes = []
+    cache = PrimeCache()
+    lpf_table = LeastFactorTable()
 
     @staticmethod
     def is_prime(n: int) -> bool:
-        for p in Primes.primes:
-            if n % p == 0:
-                return False
-        Primes.primes.append(n)
-        return True
+        return is_prime(n)
+
+    @staticmethod
+    def are_prime(numbers: Iterable[int]) -> List[bool]:
+        lp = Primes.lpf_table.lp
+        limit = len(lp)
+        return [n >= 2 and not lp[n] if n < limit else is_prime(n) for n in numbers]
 
     @staticmethod
-    def stream():
-        n = 2
-        Primes.primes = [n]
-        yield n
+    def use_cache_file(path: str, capacity: int = PRIME_CACHE_LIMIT):
+        Primes.cache = PersistentPrimeCache(path, capacity)
+
+    @staticmethod
+    def stream(cache: PrimeCache = None, workers: int = None):
+        if cache is None:
+            cache = Primes.cache
+        i = 0
         while True:
-            n += 1
-            if Primes.is_prime(n):
-                yield n
+            chunk = cache.read(i)
+            if not chunk:
+                break
+            i += len(chunk)
+            yield from chunk
+        # дальше кэша каждый поток досеивает сам
+        if workers:
+            yield from parallel_stream(cache.frontier, workers)
+        else:
+            yield from SegmentedSieve(cache.frontier)
+
+    @staticmethod
+    def range(lo: int, hi: int, workers: int = None):
+        cache = Primes.cache
+        with cache.lock:
+            if hi <= cache.frontier:
+                return as_output(cache.copy(bisect_left(cache.primes, lo), bisect_left(cache.primes, hi)))
+        if workers and hi - lo > PARALLEL_TASK_SPAN:
+            return as_output(parallel_sieve_range(lo, hi, workers))
+        return as_output(sieve_range(lo, hi))
+
+    @staticmethod
+    def take(n: int):
+        cache = Primes.cache
+        with cache.lock:
+            if n <= len(cache.primes):
+                return as_output(cache.copy(0, n))
+        primes = sieve_range(0, nth_prime_bound(n))
+        del primes[n:]
+        return as_output(primes)
+
+    @staticmethod
+    def count(x: int) -> int:
+        cache = Primes.cache
+        with cache.lock:
+            if x < cache.frontier:
+                return bisect_left(cache.primes, x + 1)
+        return prime_count(x)
+
+    @staticmethod
+    def nth(n: int) -> int:
+        cache = Primes.cache
+        with cache.lock:
+            if 1 <= n <= len(cache.primes):
+                return cache.primes[n - 1]
+        return nth_prime(n)
 
     @staticmethod
     def eratosphene():
-        lp = defaultdict(lambda: 0)
-        pr = []
-        i = 2
-        while True:
-            if lp[i] == 0:
-                lp[i] = i
-                pr.append(i)
-                yield i
-            for p in pr:
-                if p > lp[i]:
-                    break
-                lp[p * i] = p
-            i += 1
+        yield from LeastFactorSieve()
+
+    @staticmethod
+    def least_prime_factor(n: int) -> int:
+        return Primes.lpf_table.least_prime_factor(n)
+
+    @staticmethod
+    def factorize(n: int) -> List[Tuple[int, int]]:
+        return Primes.lpf_table.factorize(n)
 
 
 